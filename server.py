@@ -5,17 +5,56 @@ Tracks changes made by Claude Code with state management and rollback capabiliti
 """
 
 import os
+import re
 import json
+import copy
+import mmap
 import hashlib
+import zlib
 import zipfile
 import shutil
 from datetime import datetime
 from pathlib import Path
 from typing import List, Dict, Optional, Tuple
 import fnmatch
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 from fastmcp import FastMCP
 
+try:
+    import blake3
+except ImportError:  # Optional speedup, install with `pip install .[fast]`
+    blake3 = None
+
+try:
+    from fastcdc.fastcdc_cy import fastcdc_cy as fastcdc
+except ImportError:  # The pure Python fastcdc is too slow, fixed-size chunks are used instead
+    fastcdc = None
+
+try:
+    from isal import isal_zlib
+except ImportError:  # Optional SIMD deflate, the tracker's zips use zlib without it
+    isal_zlib = None
+
+try:
+    import orjson
+except ImportError:  # Optional, the stdlib json module is used instead
+    orjson = None
+
+def _isal_compressobj(level: int):
+    """Raw deflate compressor from ISA-L, with zlib levels mapped to the 0-3 range it supports"""
+    if level < 0:
+        level = isal_zlib.ISAL_DEFAULT_COMPRESSION
+    return isal_zlib.compressobj(min(level, isal_zlib.ISAL_BEST_COMPRESSION), zlib.DEFLATED, -zlib.MAX_WBITS)
+
+
+if isal_zlib is not None:
+    # zipfile binds crc32 = zlib.crc32 as a private module global and checksums every member
+    # read or written through it. ISA-L returns the same values, so this is safe process-wide,
+    # but it relies on that global and on zipfile being imported before this rebinding
+    zipfile.crc32 = isal_zlib.crc32
+
 # Initialize the MCP server
 mcp = FastMCP("Claude Code Change Tracker")
 
@@ -51,9 +90,31 @@ def get_claude_code_working_directory():
 HISTORY_DIR = ".claude-history"
 INITIAL_BACKUP = "initial_backup.zip"
 FILE_HASHES = "file_hashes.json"
+INITIAL_HASHES = "initial_hashes.json"
 METADATA_FILE = "metadata.json"
 CURRENT_STATE_FILE = "current_state.txt"
 STATES_DIR = "states"
+CHUNKS_DIR = "chunks"
+
+# Hash used for change detection only, so pick the fastest one available
+HASH_ALGORITHM = "blake3" if blake3 is not None else "blake2b"
+HASH_CHUNK_SIZE = 1 << 20
+# Files at least this large are hashed straight from the page cache through mmap
+HASH_MMAP_THRESHOLD = 16 << 20
+# Hashing releases the GIL, so threads overlap disk reads across files
+HASH_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+# Already compressed formats are stored as is, everything else gets fast deflate
+NO_COMPRESS_EXTENSIONS = {
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".mp3", ".mp4",
+    ".zip", ".gz", ".xz", ".bz2", ".7z", ".jar", ".whl", ".pdf", ".woff2"
+}
+ZIP_COMPRESS_LEVEL = 1
+# Average size of content-defined chunks in the deduplicated state store, bounds match fastcdc's
+CHUNK_AVG_SIZE = 8192
+CHUNK_MIN_SIZE = CHUNK_AVG_SIZE // 4
+CHUNK_MAX_SIZE = CHUNK_AVG_SIZE * 8
+# Chunks are deflated on disk like the zip members of the initial backup
+CHUNK_COMPRESS_LEVEL = 1
 
 # Default ignore patterns (similar to .gitignore)
 DEFAULT_IGNORE_PATTERNS = [
@@ -67,6 +128,73 @@ DEFAULT_IGNORE_PATTERNS = [
     ".claude-history/*"
 ]
 
+# "name/*" patterns are pruned by directory name during the walk, the rest are matched per file
+IGNORED_DIR_NAMES = {pattern[:-2] for pattern in DEFAULT_IGNORE_PATTERNS if pattern.endswith("/*")}
+IGNORED_DIR_NAMES.add(HISTORY_DIR)
+_IGNORE_FILE_PATTERNS = [pattern for pattern in DEFAULT_IGNORE_PATTERNS if not pattern.endswith("/*")]
+# Plain names are a set lookup, globs are folded into one alternation regex
+_IGNORE_LITERALS = {pattern for pattern in _IGNORE_FILE_PATTERNS if not any(c in pattern for c in "*?[")}
+_IGNORE_GLOBS = [pattern for pattern in _IGNORE_FILE_PATTERNS if pattern not in _IGNORE_LITERALS]
+# An empty alternation would match every path, so there is no regex without globs
+_IGNORE_RE = re.compile("|".join(fnmatch.translate(pattern) for pattern in _IGNORE_GLOBS)) if _IGNORE_GLOBS else None
+
+
+def _new_hasher(algorithm: str):
+    """Create a hash object for the given algorithm name"""
+    if algorithm == "blake3":
+        if blake3 is None:
+            raise ValueError("blake3 is not installed")
+        return blake3.blake3()
+    return hashlib.new(algorithm)
+
+
+def _unavailable_hash_message(algorithm: str) -> Optional[str]:
+    """Explain why a history hashed with the given algorithm can't be compared, None if it can"""
+    if algorithm == "blake3" and blake3 is None:
+        return "History was hashed with blake3, which is not installed. Install it with `pip install .[fast]`."
+    if algorithm != "blake3" and algorithm not in hashlib.algorithms_available:
+        return f"History was hashed with {algorithm}, which this Python does not provide."
+    return None
+
+
+def _dump_json(data, indent: bool = True) -> bytes:
+    """Serialize history files, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(data, indent=2 if indent else None).encode()
+
+
+def _parse_json(raw: bytes):
+    """Parse history files, with orjson when it is installed"""
+    if orjson is not None:
+        # orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers catch either
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def _split_chunks(data):
+    """Split a buffer into content-defined chunks"""
+    if fastcdc is not None:
+        for chunk in fastcdc(data, avg_size=CHUNK_AVG_SIZE, fat=True):
+            yield chunk.data
+        return
+    
+    # Without fastcdc, chunks end after a line whose CRC32 falls below a threshold proportional
+    # to its length. Boundaries then depend only on the content, so an inserted line changes the
+    # chunk it lands in instead of shifting every later fixed-size block
+    view = memoryview(data)
+    size = len(data)
+    start = position = 0
+    while position < size:
+        line_end = data.find(b"\n", position, start + CHUNK_MAX_SIZE)
+        end = min(line_end + 1 if line_end >= 0 else start + CHUNK_MAX_SIZE, size)
+        line = view[position:end]
+        position = end
+        if (position == size or position - start >= CHUNK_MAX_SIZE or (
+                position - start >= CHUNK_MIN_SIZE and zlib.crc32(line) < (len(line) << 32) // CHUNK_AVG_SIZE)):
+            yield bytes(view[start:position])
+            start = position
+
 
 class ChangeTracker:
     def __init__(self, project_dir: str = "."):
@@ -76,74 +204,284 @@ class ChangeTracker:
         # Always create history directory within the project directory
         self.history_dir = self.project_dir / HISTORY_DIR
         self.states_dir = self.history_dir / STATES_DIR
+        self.chunks_dir = self.history_dir / CHUNKS_DIR
+        
+        # Saved states by state number, rebuilt whenever metadata is loaded or saved
+        self._states_by_number = {}
+        # Parsed JSON files by path, reused while their (mtime_ns, size) is unchanged
+        self._json_cache = {}
+        # Parsed initial backup kept open across restores while its (mtime_ns, size) is unchanged
+        self._initial_zip = None
+        self._initial_zip_key = None
         
         # Print where the history will be stored for debugging
         print(f"[ChangeTracker] History directory will be: {self.history_dir}")
         
     def _should_ignore_file(self, file_path: str) -> bool:
         """Check if file should be ignored based on patterns"""
-        for pattern in DEFAULT_IGNORE_PATTERNS:
-            if fnmatch.fnmatch(file_path, pattern):
-                return True
-        return False
+        if file_path in _IGNORE_LITERALS:
+            return True
+        return _IGNORE_RE is not None and _IGNORE_RE.match(file_path) is not None
     
-    def _get_file_hash(self, file_path: Path) -> str:
-        """Calculate MD5 hash of file content"""
+    def _get_file_hash(self, file_path: str, algorithm: str = HASH_ALGORITHM) -> str:
+        """Calculate hash of file content without reading it into a bytes object, "" if it can't be read"""
         try:
-            with open(file_path, 'rb') as f:
-                return hashlib.md5(f.read()).hexdigest()
+            with open(file_path, 'rb', buffering=0) as f:
+                if os.fstat(f.fileno()).st_size >= HASH_MMAP_THRESHOLD:
+                    hasher = _new_hasher(algorithm)
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                        hasher.update(data)
+                    return hasher.hexdigest()
+                return hashlib.file_digest(f, lambda: _new_hasher(algorithm), _bufsize=HASH_CHUNK_SIZE).hexdigest()
         except Exception:
             return ""
     
-    def _get_all_project_files(self) -> List[Path]:
-        """Get all files in project (excluding ignored ones)"""
+    def _hash_files(self, file_paths: List[str], algorithm: str = HASH_ALGORITHM) -> List[str]:
+        """Hash several files concurrently, results are in the same order as file_paths"""
+        if len(file_paths) < 2:
+            return [self._get_file_hash(file_path, algorithm) for file_path in file_paths]
+        with ThreadPoolExecutor(max_workers=HASH_WORKERS) as executor:
+            return list(executor.map(lambda file_path: self._get_file_hash(file_path, algorithm), file_paths))
+    
+    def _get_all_project_files(self) -> List[Tuple[str, str, os.stat_result]]:
+        """Get (absolute_path, relative_path, stat) of all files in project (excluding ignored ones)"""
         files = []
-        for root, dirs, filenames in os.walk(self.project_dir):
-            # Skip history directory
-            if HISTORY_DIR in root:
+        pending = [(str(self.project_dir), "")]
+        while pending:
+            directory, relative_dir = pending.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        relative_path = os.path.join(relative_dir, entry.name) if relative_dir else entry.name
+                        
+                        if entry.is_dir(follow_symlinks=False):
+                            # Ignored directories are never descended into
+                            if entry.name not in IGNORED_DIR_NAMES:
+                                pending.append((entry.path, relative_path))
+                        elif entry.is_file() and not self._should_ignore_file(relative_path):
+                            files.append((entry.path, relative_path, entry.stat()))
+            except OSError:
+                # Unreadable directory, skip it like os.walk does
                 continue
-                
-            for filename in filenames:
-                file_path = Path(root) / filename
-                relative_path = file_path.relative_to(self.project_dir)
-                
-                if not self._should_ignore_file(str(relative_path)):
-                    files.append(file_path)
         return files
     
+    def _chunk_path(self, chunk_id: str, suffix: str = ".z") -> Path:
+        """Location of a chunk in the content-addressed chunk store.
+        
+        Chunks are stored deflated as .z files, chunk stores written before that hold raw .bin files.
+        """
+        return self.chunks_dir / chunk_id[:2] / f"{chunk_id}{suffix}"
+    
+    def _read_chunk(self, chunk_id: str) -> bytes:
+        """Read the content of a stored chunk"""
+        try:
+            return zlib.decompress(self._chunk_path(chunk_id).read_bytes())
+        except FileNotFoundError:
+            return self._chunk_path(chunk_id, ".bin").read_bytes()
+    
+    def _store_chunks(self, data) -> List[str]:
+        """Split data into chunks, store the ones not seen before and return their ids"""
+        chunk_ids = []
+        for chunk in _split_chunks(data):
+            hasher = _new_hasher(HASH_ALGORITHM)
+            hasher.update(chunk)
+            chunk_id = hasher.hexdigest()
+            chunk_path = self._chunk_path(chunk_id)
+            if not chunk_path.exists() and not self._chunk_path(chunk_id, ".bin").exists():
+                chunk_path.parent.mkdir(parents=True, exist_ok=True)
+                # Write under a temporary name so an interrupted save never leaves a truncated chunk
+                tmp_path = chunk_path.with_suffix(".tmp")
+                # ISA-L writes the same zlib format, so either library can read the chunk back
+                tmp_path.write_bytes((isal_zlib or zlib).compress(chunk, CHUNK_COMPRESS_LEVEL))
+                os.replace(tmp_path, chunk_path)
+            chunk_ids.append(chunk_id)
+        return chunk_ids
+    
+    def _store_file_chunks(self, file_path: str) -> List[str]:
+        """Store the content of a file in the chunk store"""
+        with open(file_path, 'rb') as f:
+            # Mapping is only worth it for large files, a file truncated while mapped raises SIGBUS
+            if os.fstat(f.fileno()).st_size < HASH_MMAP_THRESHOLD:
+                return self._store_chunks(f.read())
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return self._store_chunks(data)
+    
+    def _open_initial_backup(self) -> zipfile.ZipFile:
+        """Return the opened initial backup, reparsing its central directory only if the file changed"""
+        initial_backup_path = self.history_dir / INITIAL_BACKUP
+        stat = os.stat(initial_backup_path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        if self._initial_zip is None or self._initial_zip_key != key:
+            self._close_initial_backup()
+            self._initial_zip = zipfile.ZipFile(initial_backup_path, 'r')
+            self._initial_zip_key = key
+        return self._initial_zip
+    
+    def _close_initial_backup(self):
+        """Close the cached initial backup, e.g. before it is rewritten"""
+        if self._initial_zip is not None:
+            self._initial_zip.close()
+            self._initial_zip = None
+            self._initial_zip_key = None
+    
+    def _extract_member(self, zipf: zipfile.ZipFile, relative_path: str):
+        """Stream one zip member into the project"""
+        info = zipf.getinfo(relative_path.replace(os.sep, "/"))
+        file_path = self.project_dir / relative_path
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        with zipf.open(info) as src, open(file_path, 'wb') as dst:
+            if isal_zlib is not None and info.compress_type == zipfile.ZIP_DEFLATED:
+                # zipfile creates the decompressor when the member is opened and only uses it on read,
+                # swapping it here keeps ISA-L to the tracker's own zips instead of patching zipfile
+                src._decompressor = isal_zlib.decompressobj(-zlib.MAX_WBITS)
+            shutil.copyfileobj(src, dst, HASH_CHUNK_SIZE)
+    
+    def _write_file_from_chunks(self, relative_path: str, chunk_ids: List[str]):
+        """Recreate a project file by concatenating its chunks"""
+        file_path = self.project_dir / relative_path
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(file_path, 'wb') as f:
+            for chunk_id in chunk_ids:
+                f.write(self._read_chunk(chunk_id))
+    
+    def _load_state_manifest(self, state: Dict) -> Dict[str, List[str]]:
+        """Load the {path: [chunk_id, ...]} manifest of a saved state"""
+        return _parse_json((self.states_dir / state["filename"]).read_bytes())
+    
+    def _save_state_manifest(self, filename: str, manifest: Dict[str, List[str]]):
+        """Save the {path: [chunk_id, ...]} manifest of a saved state"""
+        (self.states_dir / filename).write_bytes(_dump_json(manifest, indent=False))
+    
+    def _read_json(self, path: Path):
+        """Parse a JSON file, reusing the last parsed object while the file is unchanged.
+        
+        The returned object is shared with the cache, the _load_* methods copy it so callers
+        can modify what they get without changing what later calls see.
+        """
+        stat = os.stat(path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        cached = self._json_cache.get(path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        data = _parse_json(path.read_bytes())
+        self._json_cache[path] = (key, data)
+        return data
+    
+    def _write_json(self, path: Path, data):
+        """Write a JSON file, the next read parses it again"""
+        # Dropped first, so neither a failed write nor later changes to data reach the cache
+        self._json_cache.pop(path, None)
+        path.write_bytes(_dump_json(data))
+    
     def _load_metadata(self) -> Dict:
         """Load metadata about saved states"""
         metadata_path = self.history_dir / METADATA_FILE
-        if metadata_path.exists():
-            try:
-                with open(metadata_path, 'r') as f:
-                    return json.load(f)
-            except (FileNotFoundError, json.JSONDecodeError):
-                pass
-        return {"states": [], "current_state": 0}
+        metadata = {"states": [], "current_state": 0}
+        try:
+            metadata = copy.deepcopy(self._read_json(metadata_path))
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+        self._states_by_number = {state["state_number"]: state for state in metadata["states"]}
+        return metadata
     
     def _save_metadata(self, metadata: Dict):
         """Save metadata about saved states"""
         metadata_path = self.history_dir / METADATA_FILE
-        with open(metadata_path, 'w') as f:
-            json.dump(metadata, f, indent=2)
+        self._write_json(metadata_path, metadata)
+        self._states_by_number = {state["state_number"]: state for state in metadata["states"]}
     
-    def _load_file_hashes(self) -> Dict[str, str]:
-        """Load initial file hashes"""
+    def _load_file_hashes(self) -> Dict:
+        """Load the file hashes of the last saved or restored state.
+        
+        Returns {"algorithm": ..., "state": ..., "files": {path: entry}} where each
+        entry is {"size": ..., "mtime_ns": ..., "hash": ...} so unchanged files can
+        be recognised from their stat result without rehashing.
+        """
         hash_path = self.history_dir / FILE_HASHES
-        if hash_path.exists():
-            try:
-                with open(hash_path, 'r') as f:
-                    return json.load(f)
-            except (FileNotFoundError, json.JSONDecodeError):
-                pass
-        return {}
+        try:
+            data = self._read_json(hash_path)
+            if "algorithm" in data and "files" in data:
+                # Entries only hold scalars, so copying each one copies the whole snapshot
+                return {
+                    "algorithm": data["algorithm"],
+                    "state": data.get("state", 0),
+                    "files": {path: dict(entry) for path, entry in data["files"].items()}
+                }
+            # Older histories stored a flat {path: md5} mapping of the initial files
+            return {
+                "algorithm": "md5",
+                "state": 0,
+                "files": {path: {"hash": file_hash} for path, file_hash in data.items()}
+            }
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+        return {"algorithm": HASH_ALGORITHM, "state": 0, "files": {}}
     
-    def _save_file_hashes(self, hashes: Dict[str, str]):
-        """Save file hashes"""
+    def _save_file_hashes(self, hashes: Dict[str, Dict], algorithm: str = HASH_ALGORITHM, state_number: int = 0):
+        """Save file hashes of the given state"""
+        # Older histories only have file_hashes.json, keep the initial hashes before overwriting it
+        if not (self.history_dir / INITIAL_HASHES).exists():
+            initial_algorithm, initial_hashes = self._load_initial_hashes()
+            self._save_initial_hashes(initial_hashes, initial_algorithm)
+        
         hash_path = self.history_dir / FILE_HASHES
-        with open(hash_path, 'w') as f:
-            json.dump(hashes, f, indent=2)
+        self._write_json(hash_path, {"algorithm": algorithm, "state": state_number, "files": hashes})
+    
+    def _load_initial_hashes(self) -> Tuple[str, Dict[str, str]]:
+        """Load hashes of the files in the initial backup"""
+        hash_path = self.history_dir / INITIAL_HASHES
+        try:
+            data = self._read_json(hash_path)
+            return data["algorithm"], dict(data["files"])
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            pass
+        # Older histories only kept the initial hashes in file_hashes.json
+        snapshot = self._load_file_hashes()
+        if snapshot["state"] != 0:
+            return snapshot["algorithm"], {}
+        return snapshot["algorithm"], {path: entry["hash"] for path, entry in snapshot["files"].items()}
+    
+    def _save_initial_hashes(self, hashes: Dict[str, str], algorithm: str = HASH_ALGORITHM):
+        """Save hashes of the files in the initial backup"""
+        hash_path = self.history_dir / INITIAL_HASHES
+        self._write_json(hash_path, {"algorithm": algorithm, "files": hashes})
+    
+    def _scan_project(self, previous_hashes: Dict[str, Dict], algorithm: str) -> Tuple[Dict[str, str], Dict[str, Dict]]:
+        """Hash the current project files, reusing previous entries whose size and mtime still match.
+        
+        Entries are only reused for files last modified before file_hashes.json was written.
+        Like git's racily clean index entries, a file edited within the same timestamp tick as
+        the snapshot keeps its size and mtime while its content changes, so it is rehashed.
+        
+        Returns ({relative_path: absolute_path}, {relative_path: entry}) in walk order.
+        """
+        file_paths = {}
+        current_hashes = {}
+        try:
+            snapshot_mtime_ns = os.stat(self.history_dir / FILE_HASHES).st_mtime_ns
+        except FileNotFoundError:
+            snapshot_mtime_ns = 0
+        
+        # Compare stat info first, only files that look modified need hashing
+        candidates = []
+        for file_path, relative_path, stat in self._get_all_project_files():
+            file_paths[relative_path] = file_path
+            entry = previous_hashes.get(relative_path)
+            # Same size and mtime as when last hashed, content is unchanged
+            if (entry is not None and entry.get("hash") and entry.get("size") == stat.st_size
+                    and entry.get("mtime_ns") == stat.st_mtime_ns and stat.st_mtime_ns < snapshot_mtime_ns):
+                current_hashes[relative_path] = entry
+                continue
+            candidates.append((file_path, relative_path, stat))
+        
+        new_hashes = self._hash_files([file_path for file_path, _, _ in candidates], algorithm)
+        for (file_path, relative_path, stat), file_hash in zip(candidates, new_hashes):
+            current_hashes[relative_path] = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "hash": file_hash
+            }
+        return file_paths, current_hashes
     
     def initialize_tracking(self) -> Dict[str, any]:
         """Initialize tracking by creating initial backup and file hashes"""
@@ -151,6 +489,7 @@ class ChangeTracker:
         print(f"[ChangeTracker] Creating history directory at: {self.history_dir}")
         self.history_dir.mkdir(exist_ok=True)
         self.states_dir.mkdir(exist_ok=True)
+        self.chunks_dir.mkdir(exist_ok=True)
         print(f"[ChangeTracker] History directory created successfully")
         
         # Get all project files
@@ -159,16 +498,36 @@ class ChangeTracker:
         # Create initial backup zip
         initial_backup_path = self.history_dir / INITIAL_BACKUP
         file_hashes = {}
+        self._close_initial_backup()
         
-        with zipfile.ZipFile(initial_backup_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for file_path in project_files:
-                relative_path = file_path.relative_to(self.project_dir)
-                zipf.write(file_path, relative_path)
+        with zipfile.ZipFile(initial_backup_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=ZIP_COMPRESS_LEVEL) as zipf:
+            for file_path, relative_path, stat in project_files:
+                # Read each file once, feeding the same chunks to the hash and the zip entry
+                info = zipfile.ZipInfo.from_file(file_path, relative_path)
+                if os.path.splitext(relative_path)[1].lower() in NO_COMPRESS_EXTENSIONS:
+                    info.compress_type = zipfile.ZIP_STORED
+                else:
+                    info.compress_type = zipfile.ZIP_DEFLATED
+                    info._compresslevel = ZIP_COMPRESS_LEVEL
+                hasher = _new_hasher(HASH_ALGORITHM)
+                with open(file_path, 'rb') as src, zipf.open(info, 'w', force_zip64=True) as dst:
+                    if isal_zlib is not None and info.compress_type == zipfile.ZIP_DEFLATED:
+                        # open() has built zipfile's compressor but written no data yet, so it can still be replaced
+                        dst._compressor = _isal_compressobj(ZIP_COMPRESS_LEVEL)
+                    while chunk := src.read(HASH_CHUNK_SIZE):
+                        hasher.update(chunk)
+                        dst.write(chunk)
                 
-                # Store file hash
-                file_hashes[str(relative_path)] = self._get_file_hash(file_path)
+                # Store file hash with the stat info from the walk, so a file
+                # modified meanwhile is rehashed on the next save
+                file_hashes[relative_path] = {
+                    "size": stat.st_size,
+                    "mtime_ns": stat.st_mtime_ns,
+                    "hash": hasher.hexdigest()
+                }
         
-        # Save file hashes
+        # Save file hashes, the initial ones stay untouched for restoring to state 0
+        self._save_initial_hashes({path: entry["hash"] for path, entry in file_hashes.items()})
         self._save_file_hashes(file_hashes)
         
         # Initialize metadata
@@ -188,61 +547,75 @@ class ChangeTracker:
         }
     
     def save_current_changes(self, prompt_text: str = "", description: str = "") -> Dict[str, any]:
-        """Save current changes compared to initial state"""
+        """Save changes made since the last saved or restored state"""
         if not (self.history_dir / INITIAL_BACKUP).exists():
             return {"status": "error", "message": "Not initialized. Run initialize_tracking() first."}
         
-        # Load initial file hashes
-        initial_hashes = self._load_file_hashes()
-        
-        # Find changed files
-        changed_files = []
-        current_files = self._get_all_project_files()
+        # Load hashes of the state the working tree is based on
+        snapshot = self._load_file_hashes()
+        algorithm = snapshot["algorithm"]
+        previous_hashes = snapshot["files"]
+        message = _unavailable_hash_message(algorithm)
+        if message:
+            return {"status": "error", "message": message}
         
-        for file_path in current_files:
-            relative_path = str(file_path.relative_to(self.project_dir))
-            current_hash = self._get_file_hash(file_path)
-            
-            # Check if file is new or modified
-            if relative_path not in initial_hashes or initial_hashes[relative_path] != current_hash:
-                changed_files.append(file_path)
+        # Find changed files, as relative paths computed once for the manifest, metadata and result
+        file_paths, current_hashes = self._scan_project(previous_hashes, algorithm)
+        unreadable = [relative_path for relative_path, entry in current_hashes.items() if not entry["hash"]]
+        if unreadable:
+            return {"status": "error", "message": f"Could not read {', '.join(unreadable)}"}
+        changed_files = [
+            relative_path for relative_path in file_paths
+            if relative_path not in previous_hashes
+            or previous_hashes[relative_path]["hash"] != current_hashes[relative_path]["hash"]
+        ]
+        deleted_files = sorted(previous_hashes.keys() - current_hashes.keys())
         
-        if not changed_files:
+        if not changed_files and not deleted_files:
+            # Touched files still match, remember their new stat info for the next save
+            if current_hashes != previous_hashes:
+                self._save_file_hashes(current_hashes, algorithm, snapshot["state"])
             return {"status": "info", "message": "No changes detected"}
         
         # Load metadata and create new state
         metadata = self._load_metadata()
-        state_number = len(metadata["states"]) + 1
-        state_filename = f"state_{state_number:03d}.zip"
-        state_path = self.states_dir / state_filename
+        state_number = max(self._states_by_number, default=0) + 1
+        state_filename = f"state_{state_number:03d}.json"
         
-        # Create zip with changed files
-        with zipfile.ZipFile(state_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for file_path in changed_files:
-                relative_path = file_path.relative_to(self.project_dir)
-                zipf.write(file_path, relative_path)
+        # Store the files changed since the parent state as deduplicated chunks
+        self.chunks_dir.mkdir(exist_ok=True)
+        manifest = {
+            relative_path: self._store_file_chunks(file_paths[relative_path])
+            for relative_path in changed_files
+        }
+        self._save_state_manifest(state_filename, manifest)
         
         # Update metadata
         state_info = {
             "state_number": state_number,
+            "parent": snapshot["state"],
             "filename": state_filename,
             "timestamp": datetime.now().isoformat(),
             "prompt": prompt_text,
             "description": description,
-            "files_changed": [str(f.relative_to(self.project_dir)) for f in changed_files],
+            "files_changed": changed_files,
+            "files_deleted": deleted_files,
+            "file_hashes": {path: current_hashes[path]["hash"] for path in changed_files},
             "file_count": len(changed_files)
         }
         
         metadata["states"].append(state_info)
         metadata["current_state"] = state_number
         self._save_metadata(metadata)
+        self._save_file_hashes(current_hashes, algorithm, state_number)
         
         return {
             "status": "success",
-            "message": f"Saved state {state_number} with {len(changed_files)} changed files",
+            "message": f"Saved state {state_number} with {len(changed_files)} changed and {len(deleted_files)} deleted files",
             "state_number": state_number,
             "files_changed": len(changed_files),
-            "changed_files": [str(f.relative_to(self.project_dir)) for f in changed_files]
+            "changed_files": changed_files,
+            "deleted_files": deleted_files
         }
     
     def list_states(self) -> Dict[str, any]:
@@ -260,6 +633,7 @@ class ChangeTracker:
                 "prompt": state.get("prompt", "")[:100] + "..." if len(state.get("prompt", "")) > 100 else state.get("prompt", ""),
                 "description": state.get("description", ""),
                 "files_changed": state["file_count"],
+                "files_deleted": len(state.get("files_deleted", [])),
                 "is_current": state["state_number"] == metadata["current_state"]
             })
         
@@ -270,6 +644,91 @@ class ChangeTracker:
             "states": states_info
         }
     
+    def _state_chain(self, state_number: int) -> Optional[List[Dict]]:
+        """Return the states to replay over the initial backup to rebuild a state, oldest first"""
+        chain = []
+        while state_number:
+            state = self._states_by_number.get(state_number)
+            if state is None:
+                return None
+            chain.append(state)
+            # States saved before deltas were introduced are cumulative from the initial backup
+            state_number = state.get("parent", 0)
+        chain.reverse()
+        return chain
+    
+    def _restore_chain(self, chain: List[Dict], state_number: int):
+        """Bring the project to the state rebuilt from a delta chain, writing only files that differ"""
+        algorithm, initial_hashes = self._load_initial_hashes()
+        message = _unavailable_hash_message(algorithm)
+        if message:
+            # Can't tell which files differ, so leave the project untouched
+            raise ValueError(message)
+        
+        # Where each file of the target state comes from, None meaning the initial backup
+        sources = dict.fromkeys(initial_hashes)
+        target_hashes = dict(initial_hashes)
+        for state in chain:
+            recorded = state.get("file_hashes", {})
+            for relative_path in state["files_changed"]:
+                sources[relative_path] = state
+                # Older states did not record hashes of their files, those are always rewritten
+                target_hashes[relative_path] = recorded.get(relative_path)
+            for relative_path in state.get("files_deleted", []):
+                sources.pop(relative_path, None)
+                target_hashes.pop(relative_path, None)
+        
+        # Compare against the current files, trusting cached stat info instead of reading them
+        snapshot = self._load_file_hashes()
+        previous_hashes = snapshot["files"] if snapshot["algorithm"] == algorithm else {}
+        file_paths, current_hashes = self._scan_project(previous_hashes, algorithm)
+        
+        for relative_path in current_hashes.keys() - target_hashes.keys():
+            os.unlink(file_paths[relative_path])
+        to_restore = [
+            relative_path for relative_path, file_hash in target_hashes.items()
+            if not file_hash or current_hashes.get(relative_path, {}).get("hash") != file_hash
+        ]
+        
+        # Write the differing files, opening each source only once
+        manifests = {}
+        state_zips = {}
+        try:
+            for relative_path in to_restore:
+                state = sources[relative_path]
+                if state is None:
+                    self._extract_member(self._open_initial_backup(), relative_path)
+                elif state["filename"].endswith(".zip"):
+                    # States saved before the chunk store are zips of whole files
+                    if state["filename"] not in state_zips:
+                        state_zips[state["filename"]] = zipfile.ZipFile(self.states_dir / state["filename"], 'r')
+                    self._extract_member(state_zips[state["filename"]], relative_path)
+                else:
+                    if state["filename"] not in manifests:
+                        manifests[state["filename"]] = self._load_state_manifest(state)
+                    self._write_file_from_chunks(relative_path, manifests[state["filename"]][relative_path])
+        finally:
+            for state_zip in state_zips.values():
+                state_zip.close()
+        
+        # Record what the project now contains so the next save diffs against the restored state
+        restored = set(to_restore)
+        file_hashes = {}
+        for relative_path, file_hash in target_hashes.items():
+            if relative_path not in restored:
+                file_hashes[relative_path] = current_hashes[relative_path]
+                continue
+            file_path = os.path.join(self.project_dir, relative_path)
+            stat = os.stat(file_path)
+            if not file_hash:
+                file_hash = self._get_file_hash(file_path, algorithm)
+            file_hashes[relative_path] = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "hash": file_hash
+            }
+        self._save_file_hashes(file_hashes, algorithm, state_number)
+    
     def restore_to_state(self, state_number: int) -> Dict[str, any]:
         """Restore project to a specific state"""
         metadata = self._load_metadata()
@@ -279,29 +738,24 @@ class ChangeTracker:
             # Restore to initial state
             return self._restore_to_initial()
         
-        # Find the state
-        target_state = None
-        for state in metadata["states"]:
-            if state["state_number"] == state_number:
-                target_state = state
-                break
-        
+        # Find the state and the states it builds on
+        target_state = self._states_by_number.get(state_number)
         if not target_state:
             return {"status": "error", "message": f"State {state_number} not found"}
         
-        # First restore to initial state
-        initial_result = self._restore_to_initial()
-        if initial_result["status"] != "success":
-            return initial_result
+        chain = self._state_chain(state_number)
+        if chain is None:
+            return {"status": "error", "message": f"History of state {state_number} is incomplete"}
         
-        # Then apply the target state changes
-        state_path = self.states_dir / target_state["filename"]
-        if not state_path.exists():
-            return {"status": "error", "message": f"State file {target_state['filename']} not found"}
+        if not (self.history_dir / INITIAL_BACKUP).exists():
+            return {"status": "error", "message": "Initial backup not found"}
+        for state in chain:
+            if not (self.states_dir / state["filename"]).exists():
+                return {"status": "error", "message": f"State file {state['filename']} not found"}
         
         try:
-            with zipfile.ZipFile(state_path, 'r') as zipf:
-                zipf.extractall(self.project_dir)
+            # Go straight from the current files to the target state
+            self._restore_chain(chain, state_number)
             
             # Update current state
             metadata["current_state"] = state_number
@@ -328,13 +782,8 @@ class ChangeTracker:
             return {"status": "error", "message": "Initial backup not found"}
         
         try:
-            # Remove all current project files (except .claude-history)
-            for file_path in self._get_all_project_files():
-                file_path.unlink()
-            
-            # Extract initial backup
-            with zipfile.ZipFile(initial_backup_path, 'r') as zipf:
-                zipf.extractall(self.project_dir)
+            # Only files that differ from the initial backup are touched
+            self._restore_chain([], 0)
             
             # Update metadata
             metadata = self._load_metadata()
@@ -364,12 +813,7 @@ class ChangeTracker:
             }
         
         # Find the state
-        target_state = None
-        for state in metadata["states"]:
-            if state["state_number"] == state_number:
-                target_state = state
-                break
-        
+        target_state = self._states_by_number.get(state_number)
         if not target_state:
             return {"status": "error", "message": f"State {state_number} not found"}
         
@@ -381,11 +825,87 @@ class ChangeTracker:
                 "prompt": target_state.get("prompt", ""),
                 "description": target_state.get("description", ""),
                 "files_changed": target_state["files_changed"],
+                "files_deleted": target_state.get("files_deleted", []),
                 "file_count": target_state["file_count"],
                 "is_current": target_state["state_number"] == metadata["current_state"]
             }
         }
     
+    def _squash_state(self, target_state: Dict):
+        """Rewrite a state as a single delta from the initial backup"""
+        chain = self._state_chain(target_state["state_number"])
+        if chain is None:
+            raise ValueError("history is incomplete")
+        
+        # Latest state in the chain that wrote each file, None if the file was deleted
+        sources = {}
+        file_hashes = {}
+        for state in chain:
+            for relative_path in state["files_changed"]:
+                sources[relative_path] = state
+                file_hashes[relative_path] = state.get("file_hashes", {}).get(relative_path)
+            for relative_path in state.get("files_deleted", []):
+                sources[relative_path] = None
+                file_hashes.pop(relative_path, None)
+        
+        # Chunks are shared, so squashing only merges manifests; zip states are chunked on the way
+        manifest = {}
+        source_manifests = {}
+        source_zips = {}
+        self.chunks_dir.mkdir(exist_ok=True)
+        try:
+            for relative_path, state in sources.items():
+                if state is None:
+                    continue
+                filename = state["filename"]
+                if filename.endswith(".zip"):
+                    if filename not in source_zips:
+                        source_zips[filename] = zipfile.ZipFile(self.states_dir / filename, 'r')
+                    member = relative_path.replace(os.sep, "/")
+                    manifest[relative_path] = self._store_chunks(source_zips[filename].read(member))
+                else:
+                    if filename not in source_manifests:
+                        source_manifests[filename] = self._load_state_manifest(state)
+                    manifest[relative_path] = source_manifests[filename][relative_path]
+        finally:
+            for source_zip in source_zips.values():
+                source_zip.close()
+        
+        old_filename = target_state["filename"]
+        state_filename = f"state_{target_state['state_number']:03d}.json"
+        self._save_state_manifest(state_filename, manifest)
+        if old_filename != state_filename:
+            (self.states_dir / old_filename).unlink(missing_ok=True)
+        
+        files_changed = [relative_path for relative_path, state in sources.items() if state is not None]
+        target_state["filename"] = state_filename
+        target_state["parent"] = 0
+        target_state["files_changed"] = files_changed
+        target_state["files_deleted"] = [relative_path for relative_path, state in sources.items() if state is None]
+        target_state["file_hashes"] = {path: file_hash for path, file_hash in file_hashes.items() if file_hash is not None}
+        target_state["file_count"] = len(files_changed)
+    
+    def _sweep_chunks(self, states: List[Dict]):
+        """Remove chunks that none of the given states refer to"""
+        if not self.chunks_dir.exists():
+            return
+        
+        referenced = set()
+        for state in states:
+            if state["filename"].endswith(".zip"):
+                continue
+            try:
+                manifest = self._load_state_manifest(state)
+            except (FileNotFoundError, json.JSONDecodeError):
+                # Can't tell which chunks this state needs, keep them all
+                return
+            for chunk_ids in manifest.values():
+                referenced.update(chunk_ids)
+        
+        for chunk_path in self.chunks_dir.glob("*/*"):
+            if chunk_path.stem not in referenced:
+                chunk_path.unlink()
+    
     def cleanup_states(self, keep_last_n: int = 10) -> Dict[str, any]:
         """Keep only the last N states, remove older ones"""
         metadata = self._load_metadata()
@@ -398,6 +918,27 @@ class ChangeTracker:
         states_to_remove = sorted_states[:-keep_last_n]
         states_to_keep = sorted_states[-keep_last_n:]
         
+        # Kept states built on removed ones absorb their deltas so they can still be restored
+        removed_numbers = {state["state_number"] for state in states_to_remove}
+        for state in states_to_keep:
+            if state.get("parent", 0) in removed_numbers:
+                try:
+                    self._squash_state(state)
+                except Exception as e:
+                    # States squashed so far are equivalent to the originals, keep them
+                    self._save_metadata(metadata)
+                    return {"status": "error", "message": f"Failed to squash state {state['state_number']}: {str(e)}"}
+        
+        # If the working tree is based on a removed state, diff the next save against the initial files
+        snapshot = self._load_file_hashes()
+        if snapshot["state"] in removed_numbers:
+            algorithm, initial_hashes = self._load_initial_hashes()
+            rebased = {}
+            for relative_path, file_hash in initial_hashes.items():
+                entry = snapshot["files"].get(relative_path)
+                rebased[relative_path] = entry if entry and entry["hash"] == file_hash else {"hash": file_hash}
+            self._save_file_hashes(rebased, algorithm, 0)
+        
         # Remove old state files
         removed_count = 0
         for state in states_to_remove:
@@ -406,6 +947,8 @@ class ChangeTracker:
                 state_path.unlink()
                 removed_count += 1
         
+        self._sweep_chunks(states_to_keep)
+        
         # Update metadata
         metadata["states"] = states_to_keep
         self._save_metadata(metadata)
@@ -416,8 +959,24 @@ class ChangeTracker:
         }
 
 
-# Global tracker instance
-tracker = None
+# Most recently used trackers by working directory as passed, so their caches survive between tool calls
+MAX_TRACKERS = 8
+_trackers: OrderedDict[str, ChangeTracker] = OrderedDict()
+
+def _get_tracker(working_directory: str, cache: bool = True) -> ChangeTracker:
+    """Return the tracker for a working directory, creating it on first use"""
+    tracker = _trackers.get(working_directory)
+    if tracker is not None:
+        _trackers.move_to_end(working_directory)
+        return tracker
+    # Use the working directory path exactly as Claude passes it
+    tracker = ChangeTracker(working_directory)
+    if cache:
+        _trackers[working_directory] = tracker
+        while len(_trackers) > MAX_TRACKERS:
+            _, evicted = _trackers.popitem(last=False)
+            evicted._close_initial_backup()
+    return tracker
 
 # MCP Tool Definitions
 
@@ -429,8 +988,6 @@ def initialize_tracking(working_directory: str) -> str:
     Args:
         working_directory: The directory where Claude Code is currently running (REQUIRED)
     """
-    global tracker
-    
     if not working_directory:
         return json.dumps({
             "status": "error", 
@@ -444,8 +1001,7 @@ def initialize_tracking(working_directory: str) -> str:
             "message": "Working directory path is required"
         })
     
-    tracker = ChangeTracker(working_directory)
-    result = tracker.initialize_tracking()
+    result = _get_tracker(working_directory).initialize_tracking()
     result["working_directory"] = working_directory
     return json.dumps(result, indent=2)
 
@@ -459,19 +1015,13 @@ def save_current_changes(working_directory: str, prompt_text: str = "", descript
         prompt_text: The prompt that was used with Claude Code
         description: Additional description for this state
     """
-    global tracker
-    
     if not working_directory:
         return json.dumps({
             "status": "error",
             "message": "working_directory is required. Please provide the project directory path."
         })
     
-    # Use the working directory path exactly as Claude passes it
-    if not tracker or str(tracker.project_dir) != working_directory:
-        tracker = ChangeTracker(working_directory)
-    
-    result = tracker.save_current_changes(prompt_text, description)
+    result = _get_tracker(working_directory).save_current_changes(prompt_text, description)
     result["working_directory"] = working_directory
     return json.dumps(result, indent=2)
 
@@ -484,18 +1034,13 @@ def restore_to_state(working_directory: str, state_number: int) -> str:
         working_directory: The directory where the project is located (REQUIRED)
         state_number: State number to restore to (0 for initial state)
     """
-    global tracker
-    
     if not working_directory:
         return json.dumps({
             "status": "error",
             "message": "working_directory is required."
         })
     
-    if not tracker or str(tracker.project_dir) != working_directory:
-        tracker = ChangeTracker(working_directory)
-    
-    result = tracker.restore_to_state(state_number)
+    result = _get_tracker(working_directory).restore_to_state(state_number)
     result["working_directory"] = working_directory
     return json.dumps(result, indent=2)
 
@@ -507,18 +1052,13 @@ def list_states(working_directory: str) -> str:
     Args:
         working_directory: The directory where the project is located (REQUIRED)
     """
-    global tracker
-    
     if not working_directory:
         return json.dumps({
             "status": "error",
             "message": "working_directory is required."
         })
     
-    if not tracker or str(tracker.project_dir) != working_directory:
-        tracker = ChangeTracker(working_directory)
-    
-    result = tracker.list_states()
+    result = _get_tracker(working_directory).list_states()
     result["working_directory"] = working_directory
     return json.dumps(result, indent=2)
 
@@ -531,18 +1071,13 @@ def show_state_details(working_directory: str, state_number: int) -> str:
         working_directory: The directory where the project is located (REQUIRED)
         state_number: State number to show details for
     """
-    global tracker
-    
     if not working_directory:
         return json.dumps({
             "status": "error",
             "message": "working_directory is required."
         })
     
-    if not tracker or str(tracker.project_dir) != working_directory:
-        tracker = ChangeTracker(working_directory)
-    
-    result = tracker.show_state_details(state_number)
+    result = _get_tracker(working_directory).show_state_details(state_number)
     result["working_directory"] = working_directory
     return json.dumps(result, indent=2)
 
@@ -555,18 +1090,13 @@ def cleanup_old_states(working_directory: str, keep_last_n: int = 10) -> str:
         working_directory: The directory where the project is located (REQUIRED)
         keep_last_n: Number of recent states to keep (default: 10)
     """
-    global tracker
-    
     if not working_directory:
         return json.dumps({
             "status": "error",
             "message": "working_directory is required."
         })
     
-    if not tracker or str(tracker.project_dir) != working_directory:
-        tracker = ChangeTracker(working_directory)
-    
-    result = tracker.cleanup_states(keep_last_n)
+    result = _get_tracker(working_directory).cleanup_states(keep_last_n)
     result["working_directory"] = working_directory
     return json.dumps(result, indent=2)
 
@@ -584,17 +1114,17 @@ def get_current_status(working_directory: str) -> str:
             "message": "working_directory is required."
         })
     
-    # Use working directory exactly as Claude passes it
-    temp_tracker = ChangeTracker(working_directory)
-    metadata = temp_tracker._load_metadata()
+    # Status checks only read metadata, so they reuse a tracker but don't keep one alive
+    tracker = _get_tracker(working_directory, cache=False)
+    metadata = tracker._load_metadata()
     
     status_info = {
-        "is_initialized": (temp_tracker.history_dir / INITIAL_BACKUP).exists(),
+        "is_initialized": (tracker.history_dir / INITIAL_BACKUP).exists(),
         "current_state": metadata.get("current_state", 0),
         "total_states": len(metadata.get("states", [])),
         "initialized_at": metadata.get("initialized_at", "Not initialized"),
         "working_directory": working_directory,
-        "history_directory": str(temp_tracker.history_dir)
+        "history_directory": str(tracker.history_dir)
     }
     
     return json.dumps(status_info, indent=2)
@@ -0,0 +1,593 @@
+import fnmatch
+import hashlib
+import importlib.util
+import json
+import os
+import sys
+import types
+import zipfile
+import zlib
+
+import pytest
+
+import server
+from server import ChangeTracker, HISTORY_DIR
+
+
+def _write(project, relative_path, content):
+    path = project / relative_path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+
+
+def _snapshot(project):
+    """Contents of the project files, excluding the history directory"""
+    files = {}
+    for root, dirs, names in os.walk(project):
+        dirs[:] = [name for name in dirs if name != HISTORY_DIR]
+        for name in names:
+            path = os.path.join(root, name)
+            with open(path) as f:
+                files[os.path.relpath(path, project)] = f.read()
+    return files
+
+
+@pytest.fixture
+def project(tmp_path):
+    _write(tmp_path, "README.md", "readme v0")
+    _write(tmp_path, "src/app.py", "app v0")
+    _write(tmp_path, "src/util.py", "util v0")
+    _write(tmp_path, "debug.log", "ignored")
+    return tmp_path
+
+
+@pytest.fixture
+def tracker(project):
+    tracker = ChangeTracker(str(project))
+    assert tracker.initialize_tracking()["status"] == "success"
+    return tracker
+
+
+def test_save_records_deltas_from_the_previous_state(project, tracker):
+    _write(project, "src/app.py", "app v1")
+    _write(project, "src/new.py", "new v1")
+    first = tracker.save_current_changes("first")
+    assert first["status"] == "success"
+    assert sorted(first["changed_files"]) == [os.path.join("src", "app.py"), os.path.join("src", "new.py")]
+    assert first["deleted_files"] == []
+
+    (project / "src" / "util.py").unlink()
+    second = tracker.save_current_changes("second")
+    assert second["changed_files"] == []
+    assert second["deleted_files"] == [os.path.join("src", "util.py")]
+
+    assert tracker.save_current_changes("none")["status"] == "info"
+
+    states = tracker._load_metadata()["states"]
+    assert [state["parent"] for state in states] == [0, first["state_number"]]
+    assert states[1]["files_deleted"] == [os.path.join("src", "util.py")]
+    initial = json.loads((project / HISTORY_DIR / server.INITIAL_HASHES).read_text())
+    assert sorted(initial["files"]) == ["README.md", os.path.join("src", "app.py"), os.path.join("src", "util.py")]
+
+
+@pytest.mark.parametrize("size", [0, 5000, server.HASH_CHUNK_SIZE + 1, server.HASH_MMAP_THRESHOLD + 4096])
+def test_file_hash_matches_hashing_the_whole_content(tmp_path, tracker, monkeypatch, size):
+    content = os.urandom(size)
+    path = tmp_path / "data.bin"
+    path.write_bytes(content)
+    mapped = []
+    real_mmap = server.mmap.mmap
+
+    def recording_mmap(*args, **kwargs):
+        mapped.append(args)
+        return real_mmap(*args, **kwargs)
+
+    monkeypatch.setattr(server.mmap, "mmap", recording_mmap)
+    for algorithm in {"blake2b", server.HASH_ALGORITHM}:
+        hasher = server._new_hasher(algorithm)
+        hasher.update(content)
+        assert tracker._get_file_hash(str(path), algorithm) == hasher.hexdigest()
+    # Only files at or above the threshold are hashed from a mapping
+    assert bool(mapped) == (size >= server.HASH_MMAP_THRESHOLD)
+
+
+def test_walk_prunes_ignored_directories_at_any_depth(project, tracker):
+    for relative_path in ("node_modules/pkg/index.js", "web/node_modules/pkg/index.js",
+                          "src/__pycache__/app.pyc", "vendor/.git/HEAD", "web/app.js"):
+        _write(project, relative_path, "content")
+
+    walked = tracker._get_all_project_files()
+    relative_paths = sorted(relative_path for _, relative_path, _ in walked)
+    assert relative_paths == sorted([
+        "README.md", os.path.join("src", "app.py"), os.path.join("src", "util.py"), os.path.join("web", "app.js")
+    ])
+    for file_path, relative_path, stat in walked:
+        assert file_path == str(project / relative_path)
+        assert stat.st_size == os.stat(file_path).st_size
+
+
+@pytest.mark.parametrize("relative_path", [
+    ".env", "src/.env", ".envrc", ".DS_Store", "docs/.DS_Store", "app.pyc", "pkg/mod/app.pyc", "app.pyc.txt",
+    "debug.log", "logs/2024/debug.log", "log", "app.py", "[weird].log", "*.log", "a?.pyc"
+])
+def test_ignore_rules_match_fnmatch(tracker, relative_path):
+    file_patterns = [pattern for pattern in server.DEFAULT_IGNORE_PATTERNS if not pattern.endswith("/*")]
+    expected = any(fnmatch.fnmatchcase(relative_path, pattern) for pattern in file_patterns)
+    assert tracker._should_ignore_file(relative_path) == expected
+
+
+def test_literal_only_ignore_rules_ignore_nothing_else(tracker, monkeypatch):
+    monkeypatch.setattr(server, "_IGNORE_RE", None)
+    assert tracker._should_ignore_file(".env")
+    assert not tracker._should_ignore_file("app.py")
+
+
+def test_initial_backup_stores_compressed_formats_and_deflates_the_rest(project):
+    source = "".join(f"print({number})\n" for number in range(2000))
+    _write(project, "src/big.py", source)
+    (project / "logo.PNG").write_bytes(b"\x89PNG" + os.urandom(4096))
+    ChangeTracker(str(project)).initialize_tracking()
+
+    with zipfile.ZipFile(project / HISTORY_DIR / server.INITIAL_BACKUP) as zipf:
+        assert zipf.getinfo("logo.PNG").compress_type == zipfile.ZIP_STORED
+        info = zipf.getinfo("src/big.py")
+        assert info.compress_type == zipfile.ZIP_DEFLATED
+        assert zipf.read(info) == source.encode()
+    if server.isal_zlib is None:
+        compressor = zlib.compressobj(server.ZIP_COMPRESS_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+        assert info.compress_size == len(compressor.compress(source.encode()) + compressor.flush())
+
+
+class _FakeIsalZlib(types.ModuleType):
+    """Stands in for isal.isal_zlib, delegating to zlib and recording which hooks ran"""
+    ISAL_DEFAULT_COMPRESSION = 2
+    ISAL_BEST_COMPRESSION = 3
+
+    def __init__(self):
+        super().__init__("isal.isal_zlib")
+        self.compress_levels = []
+        self.decompressors = 0
+        self.checksums = 0
+
+    def compressobj(self, level, method, wbits):
+        assert 0 <= level <= self.ISAL_BEST_COMPRESSION
+        self.compress_levels.append(level)
+        return zlib.compressobj(level, method, wbits)
+
+    def decompressobj(self, wbits):
+        self.decompressors += 1
+        return zlib.decompressobj(wbits)
+
+    def compress(self, data, level):
+        return zlib.compress(data, level)
+
+    def crc32(self, data, value=0):
+        self.checksums += 1
+        return zlib.crc32(data, value)
+
+
+@pytest.fixture
+def isal_server(monkeypatch):
+    """A separate copy of the server module imported with a fake isal installed"""
+    fake = _FakeIsalZlib()
+    package = types.ModuleType("isal")
+    package.isal_zlib = fake
+    monkeypatch.setitem(sys.modules, "isal", package)
+    monkeypatch.setitem(sys.modules, "isal.isal_zlib", fake)
+    # Importing the server rebinds zipfile.crc32, put the stdlib one back afterwards
+    monkeypatch.setattr(zipfile, "crc32", zipfile.crc32)
+    spec = importlib.util.spec_from_file_location("server_with_isal", server.__file__)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module, fake
+
+
+def test_isal_deflates_only_the_trackers_zips(project, isal_server):
+    module, fake = isal_server
+    assert zipfile.zlib is zlib
+    tracker = module.ChangeTracker(str(project))
+    tracker.initialize_tracking()
+    assert fake.compress_levels and set(fake.compress_levels) == {server.ZIP_COMPRESS_LEVEL}
+
+    _write(project, "src/app.py", "app edit")
+    tracker.restore_to_state(0)
+    assert fake.decompressors == 1
+    assert (project / "src" / "app.py").read_text() == "app v0"
+
+    # Deflated zips written elsewhere in the process keep using zlib at its default level
+    compress_levels = list(fake.compress_levels)
+    with zipfile.ZipFile(project / "other.zip", "w", zipfile.ZIP_DEFLATED) as zipf:
+        zipf.writestr("x", b"hi")
+    assert fake.compress_levels == compress_levels
+
+    assert module._isal_compressobj(-1) is not None
+    assert module._isal_compressobj(9) is not None
+    assert fake.compress_levels[-2:] == [fake.ISAL_DEFAULT_COMPRESSION, fake.ISAL_BEST_COMPRESSION]
+
+
+def test_isal_computes_zip_checksums(project, isal_server):
+    module, fake = isal_server
+    assert zipfile.crc32 == fake.crc32
+    module.ChangeTracker(str(project)).initialize_tracking()
+    assert fake.checksums > 0
+
+    with zipfile.ZipFile(project / HISTORY_DIR / server.INITIAL_BACKUP) as zipf:
+        for info in zipf.infolist():
+            assert info.CRC == zlib.crc32((project / info.filename).read_bytes())
+
+
+def _tag_history_algorithm(project, algorithm):
+    """Pretend the history was hashed with another algorithm"""
+    for name in (server.FILE_HASHES, server.INITIAL_HASHES):
+        path = project / HISTORY_DIR / name
+        data = json.loads(path.read_text())
+        data["algorithm"] = algorithm
+        path.write_text(json.dumps(data))
+
+
+def test_state_listings_show_deleted_files(project, tracker):
+    (project / "README.md").unlink()
+    tracker.save_current_changes("delete only")
+
+    listed = tracker.list_states()["states"][0]
+    assert listed["files_changed"] == 0
+    assert listed["files_deleted"] == 1
+    details = tracker.show_state_details(1)["state_info"]
+    assert details["files_changed"] == []
+    assert details["files_deleted"] == ["README.md"]
+
+
+def test_loaded_history_is_a_copy_of_the_cache(project, tracker, monkeypatch):
+    _write(project, "src/app.py", "app v1")
+    tracker.save_current_changes("first")
+
+    tracker._load_metadata()["states"].append({"state_number": 99})
+    tracker._load_file_hashes()["files"].clear()
+    assert [state["state_number"] for state in tracker._load_metadata()["states"]] == [1]
+    assert tracker._load_file_hashes()["files"]
+
+    # A failed write leaves the cache matching what is on disk
+    def failing_dump(data, indent=True):
+        raise OSError("disk full")
+
+    metadata = tracker._load_metadata()
+    metadata["states"][0]["description"] = "never written"
+    monkeypatch.setattr(server, "_dump_json", failing_dump)
+    with pytest.raises(OSError):
+        tracker._save_metadata(metadata)
+    monkeypatch.undo()
+    assert tracker._load_metadata()["states"][0]["description"] == ""
+
+
+def test_history_files_changed_on_disk_are_reparsed(project, tracker):
+    tracker._load_metadata()
+    metadata_path = project / HISTORY_DIR / server.METADATA_FILE
+    metadata = json.loads(metadata_path.read_text())
+    metadata["initialized_at"] = "elsewhere"
+    metadata_path.write_text(json.dumps(metadata))
+    assert tracker._load_metadata()["initialized_at"] == "elsewhere"
+
+
+def test_initial_backup_stays_open_until_it_changes(project, tracker):
+    _write(project, "src/app.py", "app edit")
+    tracker.restore_to_state(0)
+    opened = tracker._initial_zip
+    assert opened is not None
+
+    _write(project, "src/app.py", "app edit again")
+    tracker.restore_to_state(0)
+    assert tracker._initial_zip is opened
+
+    # A backup changed on disk is reopened
+    backup_path = project / HISTORY_DIR / server.INITIAL_BACKUP
+    stat = os.stat(backup_path)
+    os.utime(backup_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    _write(project, "src/app.py", "app edit")
+    tracker.restore_to_state(0)
+    assert tracker._initial_zip is not opened
+    assert opened.fp is None
+
+    # Reinitializing closes the old backup before rewriting it, restores read the new one
+    _write(project, "src/app.py", "app v1")
+    reopened = tracker._initial_zip
+    tracker.initialize_tracking()
+    assert reopened.fp is None and tracker._initial_zip is None
+    _write(project, "src/app.py", "app edit")
+    tracker.restore_to_state(0)
+    assert (project / "src" / "app.py").read_text() == "app v1"
+
+
+def test_trackers_are_cached_per_path_with_a_cap(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "_trackers", server.OrderedDict())
+    monkeypatch.setattr(server, "MAX_TRACKERS", 2)
+    projects = []
+    for name in ("a", "b", "c"):
+        _write(tmp_path / name, "file.txt", name)
+        projects.append(str(tmp_path / name))
+
+    first = server._get_tracker(projects[0])
+    first.initialize_tracking()
+    _write(tmp_path / "a", "file.txt", "edited")
+    first.restore_to_state(0)
+    assert first._initial_zip is not None
+    assert server._get_tracker(projects[0]) is first
+    # The key is the path as passed, not the resolved one
+    assert server._get_tracker(projects[0] + "/.") is not first
+
+    server._get_tracker(projects[1])
+    assert projects[0] not in server._trackers
+    assert first._initial_zip is None
+
+    server.get_current_status(projects[2])
+    assert projects[2] not in server._trackers
+
+
+def test_history_hashed_with_a_missing_algorithm_is_an_error(project, tracker, monkeypatch):
+    _write(project, "src/app.py", "app v1")
+    tracker.save_current_changes("first")
+    _tag_history_algorithm(project, "blake3")
+    monkeypatch.setattr(server, "blake3", None)
+
+    _write(project, "src/app.py", "app v2")
+    saved = tracker.save_current_changes("second")
+    assert saved["status"] == "error"
+    assert "blake3" in saved["message"]
+
+    restored = tracker.restore_to_state(0)
+    assert restored["status"] == "error"
+    assert "blake3" in restored["message"]
+    assert (project / "src" / "app.py").read_text() == "app v2"
+
+
+def test_unreadable_files_are_not_saved_with_an_empty_hash(project, tracker, monkeypatch):
+    _write(project, "src/app.py", "app v1")
+    monkeypatch.setattr(ChangeTracker, "_get_file_hash", lambda self, file_path, algorithm=None: "")
+    saved = tracker.save_current_changes("unreadable")
+    assert saved["status"] == "error"
+    assert os.path.join("src", "app.py") in saved["message"]
+    assert tracker._load_metadata()["states"] == []
+
+
+def _age_files(project, seconds=3600):
+    """Move file mtimes into the past, as if they were last edited long before the snapshot"""
+    for root, _, names in os.walk(project):
+        for name in names:
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns - seconds * 10**9))
+
+
+def test_unchanged_files_are_not_rehashed(project, monkeypatch):
+    _age_files(project)
+    tracker = ChangeTracker(str(project))
+    tracker.initialize_tracking()
+    hashed = []
+    original = ChangeTracker._hash_files
+
+    def recording_hash_files(self, file_paths, algorithm):
+        hashed.extend(file_paths)
+        return original(self, file_paths, algorithm)
+
+    monkeypatch.setattr(ChangeTracker, "_hash_files", recording_hash_files)
+
+    assert tracker.save_current_changes("none")["status"] == "info"
+    assert hashed == []
+
+    _write(project, "src/app.py", "app v1")
+    assert tracker.save_current_changes("first")["changed_files"] == [os.path.join("src", "app.py")]
+    assert hashed == [str(project / "src" / "app.py")]
+
+
+def test_racily_clean_edit_is_detected(project, tracker):
+    # A same-size edit within the timestamp tick the snapshot was written in keeps size and mtime
+    entry = tracker._load_file_hashes()["files"][os.path.join("src", "app.py")]
+    _write(project, "src/app.py", "app v1")
+    os.utime(project / "src" / "app.py", ns=(entry["mtime_ns"], entry["mtime_ns"]))
+    os.utime(project / HISTORY_DIR / server.FILE_HASHES, ns=(entry["mtime_ns"], entry["mtime_ns"]))
+
+    saved = tracker.save_current_changes("same tick")
+    assert saved["changed_files"] == [os.path.join("src", "app.py")]
+
+
+def test_restore_to_initial_and_saved_states(project, tracker):
+    initial = _snapshot(project)
+    _write(project, "src/app.py", "app v1")
+    tracker.save_current_changes("first")
+    after_first = _snapshot(project)
+    (project / "README.md").unlink()
+    _write(project, "docs/guide.md", "guide v2")
+    tracker.save_current_changes("second")
+    after_second = _snapshot(project)
+
+    assert tracker.restore_to_state(0)["status"] == "success"
+    assert _snapshot(project) == initial
+    assert tracker.restore_to_state(2)["status"] == "success"
+    assert _snapshot(project) == after_second
+    assert tracker.restore_to_state(1)["status"] == "success"
+    assert _snapshot(project) == after_first
+    assert tracker._load_metadata()["current_state"] == 1
+    assert tracker.restore_to_state(7)["status"] == "error"
+
+
+def test_restore_to_sibling_branch(project, tracker):
+    _write(project, "src/app.py", "app branch a")
+    tracker.save_current_changes("branch a")
+    branch_a = _snapshot(project)
+
+    tracker.restore_to_state(0)
+    _write(project, "src/util.py", "util branch b")
+    tracker.save_current_changes("branch b")
+    branch_b = _snapshot(project)
+    assert tracker._load_metadata()["states"][1]["parent"] == 0
+
+    tracker.restore_to_state(1)
+    assert _snapshot(project) == branch_a
+    tracker.restore_to_state(2)
+    assert _snapshot(project) == branch_b
+
+
+def test_restore_rewrites_files_edited_after_a_restore(project, tracker):
+    _write(project, "src/app.py", "app v1")
+    tracker.save_current_changes("first")
+    saved = _snapshot(project)
+
+    tracker.restore_to_state(1)
+    _write(project, "src/app.py", "app edit")
+    _write(project, "src/extra.py", "extra")
+    tracker.restore_to_state(1)
+    assert _snapshot(project) == saved
+
+
+def test_cleanup_squashes_states_built_on_removed_ones(project, tracker):
+    snapshots = {}
+    for version in range(1, 5):
+        _write(project, "src/app.py", f"app v{version}")
+        _write(project, f"src/module_{version}.py", f"module {version}")
+        if version == 3:
+            (project / "README.md").unlink()
+        tracker.save_current_changes(f"state {version}")
+        snapshots[version] = _snapshot(project)
+
+    assert tracker.cleanup_states(keep_last_n=2)["status"] == "success"
+
+    states = tracker._load_metadata()["states"]
+    assert [state["state_number"] for state in states] == [3, 4]
+    assert states[0]["parent"] == 0
+    assert "README.md" in states[0]["files_deleted"]
+    assert not (tracker.states_dir / "state_001.json").exists()
+
+    for state_number in (3, 4):
+        assert tracker.restore_to_state(state_number)["status"] == "success"
+        assert _snapshot(project) == snapshots[state_number]
+
+    # New states get numbers above every existing one
+    _write(project, "src/app.py", "app v5")
+    assert tracker.save_current_changes("state 5")["state_number"] == 5
+
+
+def test_cleanup_sweeps_unreferenced_chunks(project, tracker):
+    for version in range(1, 4):
+        _write(project, "src/app.py", f"app v{version}")
+        tracker.save_current_changes(f"state {version}")
+
+    def chunk_ids():
+        return {path.stem for path in tracker.chunks_dir.glob("*/*")}
+
+    before = chunk_ids()
+    tracker.cleanup_states(keep_last_n=1)
+    after = chunk_ids()
+
+    manifest = tracker._load_state_manifest(tracker._load_metadata()["states"][0])
+    referenced = {chunk_id for ids in manifest.values() for chunk_id in ids}
+    assert after == referenced
+    assert after < before
+
+
+@pytest.mark.parametrize("use_fastcdc", [True, False])
+def test_inserted_lines_only_add_the_chunks_around_them(project, tracker, monkeypatch, use_fastcdc):
+    if use_fastcdc:
+        if server.fastcdc is None:
+            pytest.skip("fastcdc is not installed")
+    else:
+        monkeypatch.setattr(server, "fastcdc", None)
+    lines = [f"line {number}: {'x' * (number % 50)}\n" for number in range(5000)]
+    _write(project, "src/big.py", "".join(lines))
+    tracker.save_current_changes("big file")
+    first = tracker._load_state_manifest(tracker._load_metadata()["states"][0])[os.path.join("src", "big.py")]
+
+    _write(project, "src/big.py", "inserted line\n" + "".join(lines))
+    tracker.save_current_changes("inserted line")
+    second = tracker._load_state_manifest(tracker._load_metadata()["states"][1])[os.path.join("src", "big.py")]
+
+    assert len(first) > 10
+    assert len(set(second) - set(first)) <= 2
+    # Chunks are stored deflated
+    stored = sum(path.stat().st_size for path in tracker.chunks_dir.glob("*/*"))
+    assert stored < len("".join(lines)) // 2
+
+
+def test_large_files_are_chunked_through_mmap(project, tracker):
+    content = os.urandom(server.HASH_MMAP_THRESHOLD + 12345)
+    (project / "asset.bin").write_bytes(content)
+    tracker.save_current_changes("large file")
+
+    (project / "asset.bin").write_bytes(b"truncated")
+    tracker.restore_to_state(1)
+    assert (project / "asset.bin").read_bytes() == content
+
+
+def _write_baseline_history(project, states):
+    """Write a history the way the tracker did before deltas and the chunk store.
+
+    The initial backup is a zip of all tracked files, file_hashes.json is a flat {path: md5}
+    map of the initial files and every state is a zip of all files that differ from it.
+    """
+    history_dir = project / HISTORY_DIR
+    states_dir = history_dir / "states"
+    states_dir.mkdir(parents=True)
+
+    def tracked(files):
+        return {
+            relative_path: content for relative_path, content in files.items()
+            if not any(fnmatch.fnmatch(relative_path, pattern) for pattern in server.DEFAULT_IGNORE_PATTERNS)
+        }
+
+    initial = tracked(_snapshot(project))
+    with zipfile.ZipFile(history_dir / server.INITIAL_BACKUP, "w", zipfile.ZIP_DEFLATED) as zipf:
+        for relative_path, content in initial.items():
+            zipf.writestr(relative_path, content)
+    (history_dir / server.FILE_HASHES).write_text(json.dumps({
+        relative_path: hashlib.md5(content.encode()).hexdigest() for relative_path, content in initial.items()
+    }, indent=2))
+
+    metadata = {"states": [], "current_state": 0, "initialized_at": "2024-01-01T00:00:00", "total_files_tracked": len(initial)}
+    for state_number, changes in enumerate(states, 1):
+        for relative_path, content in changes.items():
+            _write(project, relative_path, content)
+        current = tracked(_snapshot(project))
+        changed = [relative_path for relative_path, content in current.items() if initial.get(relative_path) != content]
+        filename = f"state_{state_number:03d}.zip"
+        with zipfile.ZipFile(states_dir / filename, "w", zipfile.ZIP_DEFLATED) as zipf:
+            for relative_path in changed:
+                zipf.writestr(relative_path, current[relative_path])
+        metadata["states"].append({
+            "state_number": state_number,
+            "filename": filename,
+            "timestamp": "2024-01-01T00:00:00",
+            "prompt": f"state {state_number}",
+            "description": "",
+            "files_changed": changed,
+            "file_count": len(changed)
+        })
+        metadata["current_state"] = state_number
+    (history_dir / server.METADATA_FILE).write_text(json.dumps(metadata, indent=2))
+
+
+def test_restore_and_extend_a_baseline_history(project):
+    initial = _snapshot(project)
+    _write_baseline_history(project, [
+        {"src/app.py": "app v1"},
+        # Reverted files are missing from later baseline states, which are cumulative from the initial files
+        {"src/app.py": "app v0", "src/util.py": "util v2"}
+    ])
+    after_second = _snapshot(project)
+    tracker = ChangeTracker(str(project))
+
+    assert tracker.restore_to_state(1)["status"] == "success"
+    assert _snapshot(project) == {**initial, os.path.join("src", "app.py"): "app v1"}
+    assert tracker.restore_to_state(0)["status"] == "success"
+    assert _snapshot(project) == initial
+    assert tracker.restore_to_state(2)["status"] == "success"
+    assert _snapshot(project) == after_second
+
+    # A new delta state on top of a legacy one, then squashing it away from its parent
+    _write(project, "src/new.py", "new v3")
+    saved = tracker.save_current_changes("state 3")
+    assert saved["changed_files"] == [os.path.join("src", "new.py")]
+    after_third = _snapshot(project)
+    assert tracker.cleanup_states(keep_last_n=1)["status"] == "success"
+
+    tracker.restore_to_state(0)
+    assert _snapshot(project) == initial
+    tracker.restore_to_state(3)
+    assert _snapshot(project) == after_third